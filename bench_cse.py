@@ -0,0 +1,104 @@
+import argparse
+import os
+import tempfile
+from typing import Dict, List
+
+from bench_runtime import VMInterpreter, natives, vm_files
+from ijkcompiler import bundle_runtime, compile_directory
+from ijktypes import IjkOptions, IjkReport
+
+# Array heavy kernels: a histogram indexing counts[] with data[i] on both sides of the
+# assignment, a blur reading data[i] twice and a bubble sort swapping neighbours
+DRIVER: str = '''class Main:
+    static Array data, counts, smooth
+
+    fun setup(num size) -> void:
+        var num i
+        let data = Array.new(size)
+        let counts = Array.new(16)
+        let smooth = Array.new(size)
+        let i = 0
+        while (i < size):
+            let data[i] = ((i * 7) + 3) & 15
+            let i = i + 1
+        return
+
+    fun histogram(num size) -> void:
+        var num i
+        let i = 0
+        while (i < size):
+            let counts[data[i]] = counts[data[i]] + 1
+            let i = i + 1
+        return
+
+    fun blur(num size) -> void:
+        var num i
+        let i = 1
+        while (i < (size - 1)):
+            let smooth[i] = data[i - 1] + data[i] + data[i] + data[i + 1]
+            let i = i + 1
+        return
+
+    fun sort(num size) -> void:
+        var num i, j, t
+        let i = 0
+        while (i < (size - 1)):
+            let j = 0
+            while (j < ((size - 1) - i)):
+                if (data[j] > data[j + 1]):
+                    let t = data[j]
+                    let data[j] = data[j + 1]
+                    let data[j + 1] = t
+                let j = j + 1
+            let i = i + 1
+        return
+'''
+
+kernels: List[str] = ['histogram', 'blur', 'sort']
+
+
+def measure(directory: str, options: IjkOptions, size: int) -> Dict[str, int]:
+    # Compiles the driver and the bundled runtime with the options and returns the
+    # commands executed by every kernel
+    program_dir: str = os.path.join(directory, 'program')
+    runtime_dir: str = os.path.join(directory, 'runtime')
+    os.makedirs(program_dir)
+    os.makedirs(runtime_dir)
+
+    with open(os.path.join(program_dir, 'Main.ijk'), 'w') as ofile:
+        ofile.write(DRIVER)
+
+    compile_directory(program_dir, IjkReport(), options)
+    bundle_runtime(runtime_dir, IjkReport(), options)
+
+    interpreter: VMInterpreter = VMInterpreter(vm_files(program_dir) + vm_files(runtime_dir), natives)
+    interpreter.call('Memory.init')
+    interpreter.call('Math.init')
+    interpreter.call('Main.setup', size)
+
+    executed: Dict[str, int] = {}
+    for kernel in kernels:
+        interpreter.executed = 0
+        interpreter.call(f'Main.{kernel}', size)
+        executed[kernel] = interpreter.executed
+    return executed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='bench_cse')
+    parser.add_argument('--size', type=int, default=64, help='length of the arrays the kernels run on')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        without: Dict[str, int] = measure(os.path.join(directory, 'off'), IjkOptions(cse=False), args.size)
+        with_cse: Dict[str, int] = measure(os.path.join(directory, 'on'), IjkOptions(cse=True), args.size)
+
+    print(f'{"kernel":>10} {"cse off":>10} {"cse on":>10} {"saved":>8}')
+    for kernel in kernels:
+        saved: int = without[kernel] - with_cse[kernel]
+        print(f'{kernel:>10} {without[kernel]:>10} {with_cse[kernel]:>10} '
+              f'{saved / without[kernel]:>8.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+import vmb
+from ijkcompiler import bundle_runtime, compile_directory
+
+# Driver running the draw loop of Pong: every frame moves the ball (erasing and drawing
+# a circle and allocating a Vector) and moves both paddles (four rectangles)
+DRIVER: str = '''class Main:
+    static Ball ball
+    static Player left, right
+
+    fun setup() -> void:
+        let ball = Ball.new()
+        let left = Player.new(Vector.new(0, 112), 30, 4)
+        let right = Player.new(Vector.new(507, 112), 30, 4)
+        do ball.draw()
+        do left.draw()
+        do right.draw()
+        return
+
+    fun frame() -> void:
+        do ball.move()
+        do left.moveDown()
+        do right.moveUp()
+        return
+'''
+
+segment_bases: Dict[str, int] = {'local': 1, 'argument': 2, 'this': 3, 'that': 4}
+comparisons: Dict[str, Callable[[int, int], bool]] = {
+    'eq': lambda a, b: a == b,
+    'gt': lambda a, b: a > b,
+    'lt': lambda a, b: a < b,
+}
+
+
+def to_word(n: int) -> int:
+    n &= 0xFFFF
+    return n - 0x10000 if n & 0x8000 else n
+
+
+class VMInterpreter(object):
+    # Runs .vm files and counts the executed VM commands, labels are not counted. Functions
+    # missing from the loaded files fall back to the natives given by name.
+    def __init__(self, vm_paths: List[str], natives: Dict[str, Callable[..., int]] = None) -> None:
+        self.ram: List[int] = [0] * 32768
+        self.ram[0] = 256
+        self.natives: Dict[str, Callable[..., int]] = natives if natives else {}
+        self.code: List[Tuple] = []
+        self.functions: Dict[str, int] = {}
+        self.executed: int = 0
+
+        statics: int = 16
+        for path in vm_paths:
+            commands = vmb.read_text(path)
+            start: int = len(self.code)
+
+            # Labels are scoped to their function like in the VM translator
+            labels: Dict[Tuple[str, str], int] = {}
+            function: str = ''
+            for command in commands:
+                if command[0] == 'function':
+                    function = command[1]
+                    self.functions[function] = len(self.code)
+                elif command[0] == 'label':
+                    labels[(function, command[1])] = len(self.code)
+                self.code.append(command)
+
+            for i in range(start, len(self.code)):
+                command = self.code[i]
+                if command[0] == 'function':
+                    function = command[1]
+                elif command[0] in ('push', 'pop') and command[1] == 'static':
+                    self.code[i] = (command[0], 'static', statics + command[2])
+                elif command[0] in ('goto', 'if-goto'):
+                    self.code[i] = (command[0], labels[(function, command[1])])
+
+            statics += max([c[2] + 1 for c in commands if c[0] in ('push', 'pop') and c[1] == 'static'], default=0)
+
+    def call(self, name: str, *args: int) -> int:
+        ram: List[int] = self.ram
+        for arg in args:
+            ram[ram[0]] = arg
+            ram[0] += 1
+        result: int = self._invoke(name, len(args))
+        ram[0] -= 1
+        return result
+
+    def _invoke(self, name: str, nargs: int) -> int:
+        ram: List[int] = self.ram
+
+        if name not in self.functions:
+            sp: int = ram[0] - nargs
+            ram[0] = sp
+            result: int = self.natives[name](self, *ram[sp:sp + nargs])
+            ram[ram[0]] = result
+            ram[0] += 1
+            return result
+
+        sp = ram[0]
+        for value in (-1, ram[1], ram[2], ram[3], ram[4]):
+            ram[sp] = value
+            sp += 1
+        ram[2] = sp - nargs - 5
+        ram[1] = sp
+        ram[0] = sp
+        return self._run(self.functions[name])
+
+    def _run(self, pc: int) -> int:
+        ram: List[int] = self.ram
+        code: List[Tuple] = self.code
+        executed: int = 0
+        sp: int = ram[0]
+
+        while True:
+            command = code[pc]
+            action: str = command[0]
+            pc += 1
+
+            if action == 'label':
+                continue
+            executed += 1
+
+            if action == 'push':
+                segment, index = command[1], command[2]
+                if segment == 'constant':
+                    value = index
+                elif segment == 'static':
+                    value = ram[index]
+                elif segment == 'temp':
+                    value = ram[5 + index]
+                elif segment == 'pointer':
+                    value = ram[3 + index]
+                else:
+                    value = ram[ram[segment_bases[segment]] + index]
+                ram[sp] = value
+                sp += 1
+            elif action == 'pop':
+                segment, index = command[1], command[2]
+                sp -= 1
+                value = ram[sp]
+                if segment == 'static':
+                    ram[index] = value
+                elif segment == 'temp':
+                    ram[5 + index] = value
+                elif segment == 'pointer':
+                    ram[3 + index] = value
+                else:
+                    ram[ram[segment_bases[segment]] + index] = value
+            elif action in ('add', 'sub', 'and', 'or'):
+                sp -= 1
+                b, a = ram[sp], ram[sp - 1]
+                if action == 'add':
+                    ram[sp - 1] = to_word(a + b)
+                elif action == 'sub':
+                    ram[sp - 1] = to_word(a - b)
+                elif action == 'and':
+                    ram[sp - 1] = a & b
+                else:
+                    ram[sp - 1] = a | b
+            elif action in comparisons:
+                sp -= 1
+                ram[sp - 1] = -1 if comparisons[action](ram[sp - 1], ram[sp]) else 0
+            elif action == 'neg':
+                ram[sp - 1] = to_word(-ram[sp - 1])
+            elif action == 'not':
+                ram[sp - 1] = ~ram[sp - 1]
+            elif action == 'goto':
+                pc = command[1]
+            elif action == 'if-goto':
+                sp -= 1
+                if ram[sp]:
+                    pc = command[1]
+            elif action == 'function':
+                for _ in range(command[2]):
+                    ram[sp] = 0
+                    sp += 1
+            elif action == 'call':
+                ram[0] = sp
+                self.executed += executed
+                executed = 0
+                self._invoke(command[1], command[2])
+                sp = ram[0]
+            elif action == 'return':
+                frame: int = ram[1]
+                result: int = ram[sp - 1]
+                ram[ram[2]] = result
+                sp = ram[2] + 1
+                ram[4], ram[3], ram[2], ram[1] = ram[frame - 1], ram[frame - 2], ram[frame - 3], ram[frame - 4]
+                ram[0] = sp
+                self.executed += executed
+                return result
+
+
+def sys_error(interpreter: VMInterpreter, code: int) -> int:
+    raise RuntimeError(f'Sys.error({code})')
+
+
+# Stand ins for the OS classes that are not part of the bundled runtime
+natives: Dict[str, Callable[..., int]] = {
+    'Array.new': lambda interpreter, size: interpreter.call('Memory.alloc', size),
+    'Array.dispose': lambda interpreter, array: interpreter.call('Memory.deAlloc', array),
+    'Sys.error': sys_error,
+}
+
+
+def measure(vm_paths: List[str], frames: int) -> Tuple[int, List[int]]:
+    # Returns the commands executed by the setup and by each frame of the driver
+    interpreter: VMInterpreter = VMInterpreter(vm_paths, natives)
+    for class_name in ('Memory', 'Math', 'Screen'):
+        if f'{class_name}.init' in interpreter.functions:
+            interpreter.call(f'{class_name}.init')
+
+    interpreter.executed = 0
+    interpreter.call('Main.setup')
+    setup: int = interpreter.executed
+
+    per_frame: List[int] = []
+    for _ in range(frames):
+        interpreter.executed = 0
+        interpreter.call('Main.frame')
+        per_frame.append(interpreter.executed)
+    return setup, per_frame
+
+
+def vm_files(directory: str) -> List[str]:
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.vm'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='bench_runtime')
+    parser.add_argument('--stock', help='directory with the .vm files of the stock Jack OS to compare against')
+    parser.add_argument('--frames', type=int, default=20, help='frames of the draw loop to run')
+    args = parser.parse_args()
+
+    pong_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples', 'Pong')
+
+    with tempfile.TemporaryDirectory() as directory:
+        program_dir: str = os.path.join(directory, 'program')
+        runtime_dir: str = os.path.join(directory, 'runtime')
+        os.makedirs(program_dir)
+        os.makedirs(runtime_dir)
+
+        for class_name in ('Ball', 'Player', 'Vector'):
+            shutil.copy(os.path.join(pong_dir, f'{class_name}.ijk'), program_dir)
+        with open(os.path.join(program_dir, 'Main.ijk'), 'w') as ofile:
+            ofile.write(DRIVER)
+
+        compile_directory(program_dir)
+        bundle_runtime(runtime_dir)
+
+        program: List[str] = vm_files(program_dir)
+        runtime: List[str] = vm_files(runtime_dir)
+        bundled_classes = {os.path.basename(path) for path in runtime}
+
+        stock: List[str] = vm_files(args.stock) if args.stock else []
+        runs: Dict[str, List[str]] = {
+            'bundled': program + runtime + [path for path in stock if os.path.basename(path) not in bundled_classes],
+        }
+        if stock:
+            runs['stock'] = program + stock
+
+        for name, paths in runs.items():
+            setup, per_frame = measure(paths, args.frames)
+            print(f'{name:>8}: setup {setup} commands, '
+                  f'{sum(per_frame) / len(per_frame):.0f} commands per frame (max {max(per_frame)})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+from typing import List
+
+import vmb
+from ijkcompiler import compile_directory
+
+
+def generate_program(directory: str, copies: int) -> str:
+    # Builds a large .vm file out of renamed copies of the compiled Pong example
+    pong_dir: str = os.path.join(directory, 'Pong')
+    shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Examples', 'Pong'), pong_dir)
+    compile_directory(pong_dir)
+
+    lines: List[str] = []
+    for file in sorted(os.listdir(pong_dir)):
+        if file.endswith('.vm'):
+            with open(os.path.join(pong_dir, file), 'r') as ifile:
+                lines.extend(line.strip() for line in ifile if line.strip())
+
+    program_path: str = os.path.join(directory, 'Program.vm')
+    with open(program_path, 'w') as ofile:
+        for copy in range(copies):
+            for line in lines:
+                command: List[str] = line.split()
+                if command[0] in ('function', 'call'):
+                    command[1] = f'{command[1]}{copy}'
+                elif command[0] in ('label', 'goto', 'if-goto'):
+                    command[1] = f'{command[1]}_{copy}'
+                ofile.write(' '.join(command) + '\n')
+    return program_path
+
+
+def best_time(statement, repeat: int = 5) -> float:
+    return min(timeit.repeat(statement, number=1, repeat=repeat))
+
+
+def main() -> None:
+    copies: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path: str = generate_program(directory, copies)
+        binary_path: str = os.path.splitext(text_path)[0] + '.vmb'
+        vmb.encode_text(text_path).write(binary_path)
+
+        text_commands = vmb.read_text(text_path)
+        binary_program: vmb.VMBProgram = vmb.load(binary_path)
+        assert list(binary_program) == text_commands
+        binary_program.release()
+
+        def load_binary() -> None:
+            vmb.load(binary_path).release()
+
+        def decode_binary() -> None:
+            program = vmb.load(binary_path)
+            list(program)
+            program.release()
+
+        print(f'{len(text_commands)} instructions')
+        print(f'size      .vm {os.path.getsize(text_path):>10} B   .vmb {os.path.getsize(binary_path):>10} B')
+        print(f'parse     .vm {best_time(lambda: vmb.read_text(text_path)) * 1000:>10.2f} ms')
+        print(f'load     .vmb {best_time(load_binary) * 1000:>10.2f} ms')
+        print(f'decode   .vmb {best_time(decode_binary) * 1000:>10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import os
+import sys
+from typing import Dict, List, Tuple
+
+# Hack assembler, turns .asm source into 16 bit machine words
+
+predefined_symbols: Dict[str, int] = {
+    'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+    'SCREEN': 16384, 'KBD': 24576,
+    **{f'R{i}': i for i in range(16)},
+}
+
+comps: Dict[str, str] = {
+    '0':    '0101010',
+    '1':    '0111111',
+    '-1':   '0111010',
+    'D':    '0001100',
+    'A':    '0110000',
+    '!D':   '0001101',
+    '!A':   '0110001',
+    '-D':   '0001111',
+    '-A':   '0110011',
+    'D+1':  '0011111',
+    'A+1':  '0110111',
+    'D-1':  '0001110',
+    'A-1':  '0110010',
+    'D+A':  '0000010',
+    'D-A':  '0010011',
+    'A-D':  '0000111',
+    'D&A':  '0000000',
+    'D|A':  '0010101',
+    'M':    '1110000',
+    '!M':   '1110001',
+    '-M':   '1110011',
+    'M+1':  '1110111',
+    'M-1':  '1110010',
+    'D+M':  '1000010',
+    'D-M':  '1010011',
+    'M-D':  '1000111',
+    'D&M':  '1000000',
+    'D|M':  '1010101',
+}
+
+jumps: Dict[str, str] = {
+    '':     '000',
+    'JGT':  '001',
+    'JEQ':  '010',
+    'JGE':  '011',
+    'JLT':  '100',
+    'JNE':  '101',
+    'JLE':  '110',
+    'JMP':  '111',
+}
+
+
+def _clean(line: str) -> str:
+    return line.split('//')[0].replace(' ', '').replace('\t', '').strip()
+
+
+def _encode_c(instruction: str) -> int:
+    dest, _, rest = instruction.rpartition('=') if '=' in instruction else ('', '', instruction)
+    comp, _, jump = rest.partition(';')
+
+    # Commutative forms like A+D are accepted as well
+    if comp not in comps and len(comp) == 3 and comp[1] in '+&|':
+        comp = comp[2] + comp[1] + comp[0]
+
+    dest_bits: str = ''.join('1' if register in dest else '0' for register in 'ADM')
+    return int('111' + comps[comp] + dest_bits + jumps[jump], 2)
+
+
+def assemble(lines: List[str]) -> Tuple[List[int], Dict[str, int]]:
+    # Returns the program words and the symbol table, labels included
+    symbols: Dict[str, int] = dict(predefined_symbols)
+    instructions: List[str] = []
+
+    for line in lines:
+        line = _clean(line)
+        if not line:
+            continue
+        if line.startswith('('):
+            symbols[line[1:-1]] = len(instructions)
+        else:
+            instructions.append(line)
+
+    words: List[int] = []
+    next_variable: int = 16
+    for instruction in instructions:
+        if instruction.startswith('@'):
+            value: str = instruction[1:]
+            if value.isdigit():
+                words.append(int(value))
+            else:
+                if value not in symbols:
+                    symbols[value] = next_variable
+                    next_variable += 1
+                words.append(symbols[value])
+        else:
+            words.append(_encode_c(instruction))
+
+    return words, symbols
+
+
+def assemble_file(path: str) -> Tuple[List[int], Dict[str, int]]:
+    with open(path, 'r') as ifile:
+        return assemble(ifile.readlines())
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print('usage: hackasm.py file.asm')
+        sys.exit(1)
+
+    input_path: str = sys.argv[1]
+    words, _ = assemble_file(input_path)
+
+    with open(os.path.splitext(input_path)[0] + '.hack', 'w') as ofile:
+        for word in words:
+            ofile.write(f'{word:016b}\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import os
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hackasm import assemble_file
+
+RAM_SIZE: int = 32768
+SCREEN: int = 16384
+KBD: int = 24576
+SCREEN_ROWS: int = 256
+SCREEN_COLUMNS: int = 512
+
+# ALU operations by their zx nx zy ny f no bits, y is A or M depending on the a bit
+alu_operations: Dict[int, Callable[[int, int], int]] = {
+    0b101010: lambda d, y: 0,
+    0b111111: lambda d, y: 1,
+    0b111010: lambda d, y: 0xFFFF,
+    0b001100: lambda d, y: d,
+    0b110000: lambda d, y: y,
+    0b001101: lambda d, y: d ^ 0xFFFF,
+    0b110001: lambda d, y: y ^ 0xFFFF,
+    0b001111: lambda d, y: -d & 0xFFFF,
+    0b110011: lambda d, y: -y & 0xFFFF,
+    0b011111: lambda d, y: (d + 1) & 0xFFFF,
+    0b110111: lambda d, y: (y + 1) & 0xFFFF,
+    0b001110: lambda d, y: (d - 1) & 0xFFFF,
+    0b110010: lambda d, y: (y - 1) & 0xFFFF,
+    0b000010: lambda d, y: (d + y) & 0xFFFF,
+    0b010011: lambda d, y: (d - y) & 0xFFFF,
+    0b000111: lambda d, y: (y - d) & 0xFFFF,
+    0b000000: lambda d, y: d & y,
+    0b010101: lambda d, y: d | y,
+}
+
+# Decoded instruction: (is_c, value, alu, uses_m, dest_a, dest_d, dest_m, (jump_zero, jump_positive, jump_negative))
+Instruction = Tuple[bool, int, Optional[Callable[[int, int], int]], bool, bool, bool, bool, Tuple[bool, bool, bool]]
+
+
+def _generic_alu(bits: int) -> Callable[[int, int], int]:
+    # Non standard comp codes are evaluated through the ALU control bits
+    zx, nx, zy, ny, f, no = ((bits >> shift) & 1 for shift in range(5, -1, -1))
+
+    def alu(d: int, y: int) -> int:
+        x = 0 if zx else d
+        x = x ^ 0xFFFF if nx else x
+        y = 0 if zy else y
+        y = y ^ 0xFFFF if ny else y
+        out = (x + y) & 0xFFFF if f else x & y
+        return out ^ 0xFFFF if no else out
+
+    return alu
+
+
+def decode(word: int) -> Instruction:
+    if not word & 0x8000:
+        return False, word, None, False, False, False, False, (False, False, False)
+
+    bits: int = (word >> 6) & 0b111111
+    alu = alu_operations.get(bits) or _generic_alu(bits)
+    jump: Tuple[bool, bool, bool] = (bool(word & 0b010), bool(word & 0b001), bool(word & 0b100))
+
+    return True, 0, alu, bool(word & 0x1000), bool(word & 0b100000), bool(word & 0b010000), bool(word & 0b001000), jump
+
+
+class HackEmulator(object):
+    def __init__(self, words: List[int], symbols: Dict[str, int] = None) -> None:
+        self.rom: np.ndarray = np.array(words, dtype=np.uint16)
+        self.ram: np.ndarray = np.zeros(RAM_SIZE, dtype=np.uint16)
+        self.symbols: Dict[str, int] = symbols if symbols else {}
+
+        self.program: List[Instruction] = [decode(int(word)) for word in self.rom]
+        self.memory: memoryview = memoryview(self.ram)
+
+        self.a: int = 0
+        self.d: int = 0
+        self.pc: int = 0
+        self.cycles: int = 0
+        self.halted: bool = False
+
+    @classmethod
+    def from_file(cls, path: str) -> 'HackEmulator':
+        _, ext = os.path.splitext(path)
+        if ext.lower() == '.asm':
+            return cls(*assemble_file(path))
+
+        with open(path, 'r') as ifile:
+            return cls([int(line.strip(), 2) for line in ifile if line.strip()])
+
+    def reset(self) -> None:
+        self.a, self.d, self.pc = 0, 0, 0
+        self.cycles = 0
+        self.halted = False
+
+    def run(self, max_cycles: int, stop_pc: int = -1) -> int:
+        # Executes up to max_cycles instructions, stops early when the program halts (jumps to
+        # itself) or right before executing stop_pc. Returns the executed cycles.
+        program = self.program
+        memory = self.memory
+        size: int = len(program)
+        a, d, pc = self.a, self.d, self.pc
+        cycles: int = 0
+
+        while cycles < max_cycles and pc < size:
+            is_c, value, alu, uses_m, dest_a, dest_d, dest_m, jump = program[pc]
+            cycles += 1
+
+            if not is_c:
+                a = value
+                pc += 1
+            else:
+                address: int = a
+                out: int = alu(d, memory[address] if uses_m else address)
+
+                if dest_m:
+                    memory[address] = out
+                if dest_a:
+                    a = out
+                if dest_d:
+                    d = out
+
+                if out == 0:
+                    taken = jump[0]
+                elif out & 0x8000:
+                    taken = jump[2]
+                else:
+                    taken = jump[1]
+
+                if taken:
+                    if address == pc - 1 and jump == (True, True, True) and not program[address][0]:
+                        self.halted = True
+                        break
+                    pc = address
+                else:
+                    pc += 1
+
+            if pc == stop_pc:
+                break
+
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += cycles
+        return cycles
+
+    def step(self) -> None:
+        self.run(1)
+
+    def address_of(self, frame: str) -> int:
+        return int(frame) if frame.isdigit() else self.symbols[frame]
+
+    def run_frames(self, frame_pc: int, frames: int, max_cycles: int = 10 ** 9) -> List[int]:
+        # A frame is the time between two consecutive arrivals at frame_pc, for example the
+        # entry of the function that draws the game. Returns the cycles taken by each frame.
+        self.run(max_cycles, frame_pc)
+
+        # A run that halts or runs out of cycles before coming back to frame_pc is not a frame
+        cycles_per_frame: List[int] = []
+        while len(cycles_per_frame) < frames and not self.halted and self.pc == frame_pc:
+            cycles: int = self.run(max_cycles, frame_pc)
+            if self.pc == frame_pc:
+                cycles_per_frame.append(cycles)
+        return cycles_per_frame
+
+    def press_key(self, key: int) -> None:
+        self.ram[KBD] = key
+
+    def screen(self) -> np.ndarray:
+        # Pixels as a rows x columns boolean array, the lowest bit of each word is the leftmost pixel
+        words: np.ndarray = self.ram[SCREEN:KBD].astype('<u2')
+        pixels: np.ndarray = np.unpackbits(words.view(np.uint8), bitorder='little')
+        return pixels.reshape(SCREEN_ROWS, SCREEN_COLUMNS).astype(bool)
+
+    def save_screen(self, path: str) -> None:
+        # Writes the screen as a grayscale .pgm or .png image, black pixels are set bits
+        image: np.ndarray = np.where(self.screen(), 0, 255).astype(np.uint8)
+
+        if path.lower().endswith('.png'):
+            data: bytes = _encode_png(image)
+        else:
+            data = f'P5\n{SCREEN_COLUMNS} {SCREEN_ROWS}\n255\n'.encode('ascii') + image.tobytes()
+
+        with open(path, 'wb') as ofile:
+            ofile.write(data)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _encode_png(image: np.ndarray) -> bytes:
+    rows, columns = image.shape
+    scanlines: np.ndarray = np.hstack([np.zeros((rows, 1), dtype=np.uint8), image])
+
+    return b'\x89PNG\r\n\x1a\n' \
+        + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', columns, rows, 8, 0, 0, 0, 0)) \
+        + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes())) \
+        + _png_chunk(b'IEND', b'')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='hackemu')
+    parser.add_argument('path', help='.hack or .asm program to run')
+    parser.add_argument('--max-cycles', type=int, default=10 ** 7, help='cycles to run when no frame is given')
+    parser.add_argument('--frame', help='label or ROM address reached once per frame')
+    parser.add_argument('--frames', type=int, default=10, help='frames to measure')
+    parser.add_argument('--budget', type=int, help='fail if a frame takes more cycles than this')
+    parser.add_argument('--key', type=int, default=0, help='key code held down while running')
+    parser.add_argument('--screen', help='save the final screen to this .png or .pgm file')
+    args = parser.parse_args()
+
+    emulator: HackEmulator = HackEmulator.from_file(args.path)
+    emulator.press_key(args.key)
+
+    cycles_per_frame: List[int] = []
+    if args.frame:
+        cycles_per_frame = emulator.run_frames(emulator.address_of(args.frame), args.frames, args.max_cycles)
+        for i, cycles in enumerate(cycles_per_frame):
+            print(f'frame {i}: {cycles} cycles')
+        if cycles_per_frame:
+            print(f'average: {sum(cycles_per_frame) / len(cycles_per_frame):.1f} cycles per frame')
+    else:
+        emulator.run(args.max_cycles)
+
+    print(f'total: {emulator.cycles} cycles{" (halted)" if emulator.halted else ""}')
+
+    if args.screen:
+        emulator.save_screen(args.screen)
+
+    if args.budget is not None and any(cycles > args.budget for cycles in cycles_per_frame):
+        print(f'Cycle budget of {args.budget} per frame exceeded')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
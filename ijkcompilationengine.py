@@ -1,5 +1,9 @@
+import operator
+from typing import Callable, List, Optional, Set, Tuple
+
 from lexer import IndentLexer
 from vm import VMWriter
+from vmb import VMBEncoder
 from ijktypes import *
 
 binary_op_actions: Dict[str, str] = {
@@ -14,14 +18,126 @@ binary_op_actions: Dict[str, str] = {
     '=': 'eq',
 }
 
+# Binary operations evaluated at compile time when both operands are constants
+binary_op_folds: Dict[str, Callable[[int, int], int]] = {
+    '+': operator.add,
+    '-': operator.sub,
+    '&': operator.and_,
+    '|': operator.or_,
+}
+
+# Values of the keywords that can be assigned as constants
+keyword_constants: Dict[str, int] = {
+    'true':     -1,
+    'false':    0,
+    'none':     0,
+}
+
+# Trivial OS subroutines lowered inline when called as Class.fun, the arguments are already on the stack
+intrinsic_actions: Dict[str, Tuple[int, List[str]]] = {
+    'Memory.peek': (1, [
+        'pop pointer 1',
+        'push that 0',
+    ]),
+    'Memory.poke': (2, [
+        'pop temp 0',
+        'pop pointer 1',
+        'push temp 0',
+        'pop that 0',
+        'push constant 0',
+    ]),
+    'Math.abs': (1, [
+        'pop temp 1',
+        'push temp 1',
+        'push temp 1',
+        'push temp 1',
+        'push constant 0',
+        'lt',
+        'and',
+        'pop temp 2',
+        'push temp 2',
+        'push temp 2',
+        'add',
+        'sub',
+    ]),
+    'Math.min': (2, [
+        'pop temp 2',
+        'pop temp 1',
+        'push temp 2',
+        'push temp 1',
+        'push temp 2',
+        'sub',
+        'push temp 1',
+        'push temp 2',
+        'lt',
+        'and',
+        'add',
+    ]),
+    'Math.max': (2, [
+        'pop temp 2',
+        'pop temp 1',
+        'push temp 2',
+        'push temp 1',
+        'push temp 2',
+        'sub',
+        'push temp 1',
+        'push temp 2',
+        'gt',
+        'and',
+        'add',
+    ]),
+}
+
+# Intrinsics evaluated at compile time when all their arguments are constants
+intrinsic_folds: Dict[str, Callable[..., int]] = {
+    'Math.abs': abs,
+    'Math.min': min,
+    'Math.max': max,
+}
+
+# Hidden statics of classes compiled with a free list allocator, in declaration order
+pool_statics: Tuple[str, ...] = ('$free', '$allocs', '$reuses', '$frees')
+
+# Functions generated to read the allocation counters of a pooled class
+pool_counters: Dict[str, str] = {
+    'poolAllocs':   '$allocs',
+    'poolReuses':   '$reuses',
+    'poolFrees':    '$frees',
+}
+
+# Constants up to this value are multiplied through an add chain instead of Math.multiply
+MAX_REDUCED_MULTIPLIER: int = 16
+
+
+def is_power_of_two(n: int) -> bool:
+    return n > 0 and n & (n - 1) == 0
+
 
 class IjkCompilationEngine(object):
     label_count: int = 0
 
-    def __init__(self, istream, ostream) -> None:
+    def __init__(self, istream, ostream, report: IjkReport = None, options: IjkOptions = None,
+                 binary: VMBEncoder = None) -> None:
         self.lexer: IndentLexer = IndentLexer()
         self.lexer.input(istream.read())
-        self.vm: VMWriter = VMWriter(ostream)
+        self.options: IjkOptions = options if options else IjkOptions()
+
+        # Assignments to statics and fields as (class, name, value), value is None
+        # when the assignment is not a constant at the top level of its subroutine
+        self.assignments: List[Tuple[str, str, Optional[int]]] = []
+        self.depth: int = 0
+        # Names of the subroutines declared by the class, generated functions must not reuse them
+        self.subroutines: Set[str] = set()
+        # Number of while loops around the statement being compiled
+        self.loops: int = 0
+        self.returned: bool = False
+        # Powers of two the class divides by outside of loops, each one gets a helper written after the class
+        self.divisors: List[int] = []
+        # Statics and fields assigned at the top level of the current subroutine before any
+        # return, reads of other statics and of fields in an init may see their implicit zero
+        self.initialized: Set[str] = set()
+        self.report: IjkReport = report if report else IjkReport()
+        self.vm: VMWriter = VMWriter(ostream, self.report, binary, self.options.cse)
 
     def show_tokens(self):
         while t := self.lexer.token():
@@ -46,10 +162,22 @@ class IjkCompilationEngine(object):
 
         self._compile_class_vars(ijk_class)
 
+        # The free list links blocks through their first field
+        if self.options.pool_alloc and ijk_class.fields:
+            for name in pool_statics:
+                ijk_class.add_static(name, 'num')
+
         self._compile_class_subroutines(ijk_class)
 
         self.lexer.token()  # DEDENT
 
+        if ijk_class.get_symbol('$free'):
+            self._compile_pool_counters(ijk_class)
+
+        self._compile_divide_helpers(ijk_class)
+
+        self.vm.flush()
+
     def _compile_class_vars(self, ijk_class: IjkClass) -> None:
         token = self.lexer.current_token()
 
@@ -83,6 +211,7 @@ class IjkCompilationEngine(object):
             subroutine_kind: str = self.lexer.token().value
 
             subroutine_name: str = self.lexer.token().value
+            self.subroutines.add(subroutine_name)
 
             ijk_subroutine: IjkSubroutine = IjkSubroutine(subroutine_name, subroutine_kind, "None", ijk_class)
 
@@ -134,7 +263,9 @@ class IjkCompilationEngine(object):
 
         self.vm.write_function(ijk_subroutine)
 
-        if ijk_subroutine.subroutine_type == 'init':
+        if ijk_subroutine.subroutine_type == 'init' and ijk_subroutine.ijk_class.get_symbol('$free'):
+            self._compile_pool_alloc(ijk_subroutine.ijk_class)
+        elif ijk_subroutine.subroutine_type == 'init':
             fields: int = ijk_subroutine.ijk_class.fields
             self.vm.write_push('constant', fields)
             self.vm.write_call('Memory', 'alloc', 1)
@@ -143,10 +274,87 @@ class IjkCompilationEngine(object):
             self.vm.write_push('argument', 0)
             self.vm.write_pop('pointer', 0)
 
+        self.returned = False
+        self.initialized = set()
+
         self._compile_statements(ijk_subroutine)
 
+        # A field left unset by one of the constructors keeps its zero value in the objects it builds
+        if ijk_subroutine.subroutine_type == 'init':
+            class_name: str = ijk_subroutine.ijk_class.name
+            for name, symbol in ijk_subroutine.ijk_class.symbols.items():
+                if symbol.kind == 'field' and name not in self.initialized:
+                    self.assignments.append((class_name, name, None))
+
         self.lexer.token()  # DEDENT
 
+    def _compile_pool_alloc(self, ijk_class: IjkClass) -> None:
+        reuse_label: str = IjkCompilationEngine.get_label()
+        end_label: str = IjkCompilationEngine.get_label()
+
+        self.vm.write_push_symbol(ijk_class.get_symbol('$free'))
+        self.vm.write_if_goto(reuse_label)
+
+        self.vm.write_push('constant', ijk_class.fields)
+        self.vm.write_call('Memory', 'alloc', 1)
+        self.vm.write_pop('pointer', 0)
+        self._compile_pool_increment(ijk_class.get_symbol('$allocs'))
+        self.vm.write_goto(end_label)
+
+        self.vm.write_label(reuse_label)
+        self.vm.write_push_symbol(ijk_class.get_symbol('$free'))
+        self.vm.write_pop('pointer', 0)
+        self.vm.write_push('this', 0)
+        self.vm.write_pop_symbol(ijk_class.get_symbol('$free'))
+        self._compile_pool_increment(ijk_class.get_symbol('$reuses'))
+
+        self.vm.write_label(end_label)
+
+    def _compile_pool_free(self, ijk_class: IjkClass) -> None:
+        # The object is on the stack, it becomes the new head of the free list
+        self.vm.write_pop('pointer', 1)
+        self.vm.write_push_symbol(ijk_class.get_symbol('$free'))
+        self.vm.write_pop('that', 0)
+        self.vm.write_push('pointer', 1)
+        self.vm.write_pop_symbol(ijk_class.get_symbol('$free'))
+        self._compile_pool_increment(ijk_class.get_symbol('$frees'))
+        self.vm.write_int(0)
+
+    def _compile_pool_increment(self, counter: IjkSymbol) -> None:
+        self.vm.write_push_symbol(counter)
+        self.vm.write_int(1)
+        self.vm.write('add')
+        self.vm.write_pop_symbol(counter)
+
+    def _compile_pool_counters(self, ijk_class: IjkClass) -> None:
+        for fun_name, counter in pool_counters.items():
+            if fun_name in self.subroutines:
+                raise NameError(f"{ijk_class.name}.{fun_name} is generated by --pool-alloc and cannot be declared")
+            self.vm.write_function(IjkSubroutine(fun_name, 'fun', 'num', ijk_class))
+            self.vm.write_push_symbol(ijk_class.get_symbol(counter))
+            self.vm.write_return()
+
+        self.report.count('pooled_classes')
+
+    def _compile_divide_helpers(self, ijk_class: IjkClass) -> None:
+        for n in self.divisors:
+            if f'_divide{n}' in self.subroutines:
+                raise NameError(f"{ijk_class.name}._divide{n} is generated for divisions by {n} and cannot be declared")
+            self.vm.write_divide_helper(IjkSubroutine(f'_divide{n}', 'fun', 'num', ijk_class),
+                                        n, IjkCompilationEngine.get_label())
+            self.report.count('divide_helpers')
+
+    def _is_self_argument(self, ijk_subroutine: IjkSubroutine) -> bool:
+        # Checks if the upcoming argument list is just the object the method runs on
+        argument = self.lexer.peek_token(0)
+        closing = self.lexer.peek_token(1)
+
+        if not argument or not closing or closing.value != ')':
+            return False
+        if ijk_subroutine.subroutine_type != 'method':
+            return False
+        return argument.value == 'self' or (argument.type == 'IDENTIFIER' and argument.value == 'this')
+
     def _compile_subroutine_vars(self, ijk_subroutine: IjkSubroutine) -> None:
 
         token = self.lexer.current_token()
@@ -201,6 +409,7 @@ class IjkCompilationEngine(object):
 
         self.vm.write_if(false_label)
 
+        self.depth += 1
         self._compile_statements(ijk_subroutine)
 
         self.vm.write_goto(end_label)
@@ -219,6 +428,7 @@ class IjkCompilationEngine(object):
             self._compile_statements(ijk_subroutine)
 
             self.lexer.token()  # DEDENT
+        self.depth -= 1
 
         self.vm.write_label(end_label)
 
@@ -229,6 +439,7 @@ class IjkCompilationEngine(object):
         while_label: str = IjkCompilationEngine.get_label()
         false_label: str = IjkCompilationEngine.get_label()
 
+        self.loops += 1
         self.vm.write_label(while_label)
         self._compile_expression(ijk_subroutine)
 
@@ -239,7 +450,10 @@ class IjkCompilationEngine(object):
 
         self.vm.write_if(false_label)
 
+        self.depth += 1
         self._compile_statements(ijk_subroutine)
+        self.depth -= 1
+        self.loops -= 1
 
         self.vm.write_goto(while_label)
         self.vm.write_label(false_label)
@@ -260,7 +474,7 @@ class IjkCompilationEngine(object):
             self.lexer.token()  # ]
             self.lexer.token()  # =
 
-            self.vm.write_push_symbol(ijk_symbol)
+            self._compile_push_variable(ijk_subroutine, var_name, ijk_symbol)
             self.vm.write('add')
 
             self._compile_expression(ijk_subroutine)
@@ -270,10 +484,56 @@ class IjkCompilationEngine(object):
             self.vm.write_pop('that', 0)
         else:
             self.lexer.token()
+
+            if ijk_symbol.kind in ('static', 'field'):
+                value: Optional[int] = self._peek_constant()
+                promotable: bool = self.depth == 0 and not self.returned \
+                    and (ijk_symbol.kind == 'static' or ijk_subroutine.subroutine_type == 'init')
+                self.assignments.append((ijk_subroutine.ijk_class.name, var_name, value if promotable else None))
+
             self._compile_expression(ijk_subroutine)
             self.vm.write_pop_symbol(ijk_symbol)
+
+            if ijk_symbol.kind in ('static', 'field') and promotable:
+                self.initialized.add(var_name)
         self.lexer.token()  # newline
 
+    def _peek_constant(self) -> Optional[int]:
+        # Returns the value of the upcoming expression if it is a single constant
+        tokens = [self.lexer.peek_token(i) for i in range(3)]
+        end = [token is None or token.type == 'NEWLINE' for token in tokens]
+
+        if tokens[0] and tokens[0].type == 'INTEGER_CONSTANT' and end[1]:
+            return tokens[0].value
+        elif tokens[0] and tokens[0].value == '-' and tokens[1] and tokens[1].type == 'INTEGER_CONSTANT' and end[2]:
+            return -tokens[1].value
+        elif tokens[0] and tokens[0].type == 'KEYWORD' and tokens[0].value in keyword_constants and end[1]:
+            return keyword_constants[tokens[0].value]
+        return None
+
+    def _get_constant(self, ijk_subroutine: IjkSubroutine, name: str, symbol: IjkSymbol) -> Optional[int]:
+        if not symbol or symbol.kind not in ('static', 'field'):
+            return None
+        return self.options.constants.get(ijk_subroutine.ijk_class.name, {}).get(name)
+
+    def _record_read(self, ijk_subroutine: IjkSubroutine, name: str, symbol: IjkSymbol) -> None:
+        # A read that may run before the assignment sees the implicit zero, which counts as
+        # another value and keeps the symbol from being promoted
+        if name in self.initialized:
+            return
+        if symbol.kind == 'static' or (symbol.kind == 'field' and ijk_subroutine.subroutine_type == 'init'):
+            self.assignments.append((ijk_subroutine.ijk_class.name, name, None))
+
+    def _compile_push_variable(self, ijk_subroutine: IjkSubroutine, name: str, symbol: IjkSymbol) -> None:
+        self._record_read(ijk_subroutine, name, symbol)
+        constant: Optional[int] = self._get_constant(ijk_subroutine, name, symbol)
+
+        if constant is None:
+            self.vm.write_push_symbol(symbol)
+        else:
+            self.vm.write_constant(constant)
+            self.report.count('constant_reads')
+
     def _compile_statement_do(self, ijk_subroutine: IjkSubroutine) -> None:
         self.lexer.token()  # do
 
@@ -293,6 +553,7 @@ class IjkCompilationEngine(object):
 
         self.vm.write_return()
         self.lexer.token()  # newline
+        self.returned = True
 
     def _compile_expression_list(self, ijk_subroutine: IjkSubroutine) -> int:
         count: int = 0
@@ -311,19 +572,97 @@ class IjkCompilationEngine(object):
         return count
 
     def _compile_expression(self, ijk_subroutine: IjkSubroutine) -> None:
-        self._compile_term(ijk_subroutine)
+        token = self.lexer.current_token()
+        next_token = self.lexer.peek_token(1)
+        constant: Optional[int] = self._get_constant_operand(ijk_subroutine, token, next_token)
+
+        if constant is not None and next_token and next_token.value == '*' \
+                and self._can_reduce_constant('*', constant):
+            self._count_constant_read(token)
+            self.lexer.token()  # constant
+            self.lexer.token()  # *
+            self._compile_term(ijk_subroutine)
+            self._compile_constant_operation(ijk_subroutine, '*', constant)
+        else:
+            self._compile_term(ijk_subroutine)
 
         token = self.lexer.current_token()
 
         while token and token.value and token.value in '+-*/&|<>=':
             binary_op: str = self.lexer.token().value
 
-            self._compile_term(ijk_subroutine)
+            token = self.lexer.current_token()
+            constant = self._get_constant_operand(ijk_subroutine, token, self.lexer.peek_token(1))
+
+            if constant is not None and self._can_reduce_constant(binary_op, constant):
+                self._count_constant_read(token)
+                self.lexer.token()  # constant
+                self._compile_constant_operation(ijk_subroutine, binary_op, constant)
+            else:
+                self._compile_term(ijk_subroutine)
 
-            self.vm.write(binary_op_actions[binary_op])
+                if binary_op in binary_op_folds and self.vm.fold_constants(2, binary_op_folds[binary_op]):
+                    self.report.count('constants_folded')
+                else:
+                    self.vm.write(binary_op_actions[binary_op])
 
             token = self.lexer.current_token()
 
+    def _count_constant_read(self, token) -> None:
+        if token.type == 'IDENTIFIER':
+            self.report.count('constant_reads')
+
+    def _get_constant_operand(self, ijk_subroutine: IjkSubroutine, token, next_token) -> Optional[int]:
+        # Returns the value of a term made of a single integer constant or promoted variable
+        if not token:
+            return None
+        elif token.type == 'INTEGER_CONSTANT':
+            return token.value
+        elif token.type == 'IDENTIFIER' and not (next_token and next_token.value in ('[', '.', '(')):
+            constant: Optional[int] = self._get_constant(ijk_subroutine, token.value,
+                                                         ijk_subroutine.get_symbol(token.value))
+            if constant is not None and constant >= 0:
+                return constant
+        return None
+
+    def _compile_intrinsic(self, intrinsic: str) -> None:
+        args, actions = intrinsic_actions[intrinsic]
+
+        if intrinsic in intrinsic_folds and self.vm.fold_constants(args, intrinsic_folds[intrinsic]):
+            self.report.count('intrinsics_folded')
+            return
+
+        for action in actions:
+            self.vm.write(action)
+        self.report.count('intrinsics_inlined')
+
+    @staticmethod
+    def _can_reduce_constant(binary_op: str, n: int) -> bool:
+        if binary_op == '*':
+            return n <= MAX_REDUCED_MULTIPLIER or is_power_of_two(n)
+        elif binary_op == '/':
+            return is_power_of_two(n)
+        return False
+
+    def _compile_constant_operation(self, ijk_subroutine: IjkSubroutine, binary_op: str, n: int) -> None:
+        if binary_op == '*':
+            self.vm.write_multiply_constant(n)
+            self.report.count('strength_reduced_multiply')
+        elif n == 1:
+            self.report.count('strength_reduced_divide')
+        elif self.loops:
+            # Divisions run on every iteration of a loop are worth their size inline
+            slow_label: str = IjkCompilationEngine.get_label()
+            end_label: str = IjkCompilationEngine.get_label()
+            self.vm.write_divide_constant(n, slow_label, end_label)
+            self.report.count('strength_reduced_divide')
+            self.report.count('inline_divides')
+        else:
+            if n not in self.divisors:
+                self.divisors.append(n)
+            self.vm.write_call(ijk_subroutine.ijk_class.name, f'_divide{n}', 1)
+            self.report.count('strength_reduced_divide')
+
     def _compile_term(self, ijk_subroutine: IjkSubroutine) -> None:
         token = self.lexer.token()
 
@@ -357,7 +696,7 @@ class IjkCompilationEngine(object):
                 self.lexer.token()  # [
                 self._compile_expression(ijk_subroutine)
 
-                self.vm.write_push_symbol(variable)
+                self._compile_push_variable(ijk_subroutine, id_name, variable)
                 self.vm.write('add')
 
                 self.vm.write_pop('pointer', 1)
@@ -381,6 +720,7 @@ class IjkCompilationEngine(object):
                     if fun_object:
                         fun_class = variable.type
                         args = 1
+                        self._record_read(ijk_subroutine, id_name, variable)
                         self.vm.write_push_symbol(variable)
                     else:
                         fun_class = id_name
@@ -393,12 +733,24 @@ class IjkCompilationEngine(object):
 
                     self.lexer.token()  # (
 
+                    intrinsic: str = f'{fun_class}.{fun_name}'
+                    is_intrinsic: bool = not default_call and args == 0 \
+                        and self.options.intrinsics and intrinsic in intrinsic_actions
+                    is_pool_free: bool = not default_call and args == 0 and intrinsic == 'Memory.deAlloc' \
+                        and ijk_subroutine.ijk_class.get_symbol('$free') is not None \
+                        and self._is_self_argument(ijk_subroutine)
+
                     args += self._compile_expression_list(ijk_subroutine)
 
-                    self.vm.write_call(fun_class, fun_name, args)
+                    if is_pool_free:
+                        self._compile_pool_free(ijk_subroutine.ijk_class)
+                    elif is_intrinsic and intrinsic_actions[intrinsic][0] == args:
+                        self._compile_intrinsic(intrinsic)
+                    else:
+                        self.vm.write_call(fun_class, fun_name, args)
 
                     self.lexer.token()  # )
                 elif variable:
-                    self.vm.write_push_symbol(variable)
+                    self._compile_push_variable(ijk_subroutine, id_name, variable)
 
 
@@ -1,43 +1,117 @@
+import io
 import sys
 import os
+import argparse
+from typing import List, Optional, Tuple
 from ijkcompilationengine import IjkCompilationEngine
+from ijkoptimizer import find_constants
+from ijktypes import IjkOptions, IjkReport
+from vmb import VMBEncoder
 
+# IJack sources of the optimized OS classes bundled with --bundle-runtime
+RUNTIME_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Runtime')
 
-def compile_file(file_path: str) -> None:
+
+def compile_file(file_path: str, report: IjkReport = None, options: IjkOptions = None, output_dir: str = None) -> None:
     with open(file_path, 'r') as ifile:
         file_name: str = os.path.basename(file_path)
         file_path_no_ext, _ = os.path.splitext(file_path)
         file_name_no_ext, _ = os.path.splitext(file_name)
 
+        if output_dir:
+            file_path_no_ext = os.path.join(output_dir, file_name_no_ext)
+
+        binary: VMBEncoder = VMBEncoder() if options and options.binary else None
+
         ofile_path = file_path_no_ext + '.vm'
         with open(ofile_path, 'w') as ofile:
-            compiler: IjkCompilationEngine = IjkCompilationEngine(ifile, ofile)
+            compiler: IjkCompilationEngine = IjkCompilationEngine(ifile, ofile, report, options, binary)
+            compiler.compile_class()
+
+        if binary:
+            binary.write(file_path_no_ext + '.vmb')
+
+
+def analyze_files(file_paths: List[str], report: IjkReport, options: IjkOptions) -> None:
+    # Compiles every file once without output to find the statics and fields that can be promoted
+    assignments: List[Tuple[str, str, Optional[int]]] = []
+    for file_path in file_paths:
+        with open(file_path, 'r') as ifile:
+            compiler: IjkCompilationEngine = IjkCompilationEngine(ifile, io.StringIO())
             compiler.compile_class()
+            assignments.extend(compiler.assignments)
+
+    options.constants = find_constants(assignments, report)
+
+
+def compile_files(file_paths: List[str], report: IjkReport = None, options: IjkOptions = None,
+                  output_dir: str = None) -> None:
+    report = report if report else IjkReport()
+    options = options if options else IjkOptions()
 
+    if options.propagate_constants:
+        analyze_files(file_paths, report, options)
 
-def compile_directory(dir_path: str) -> None:
+    for file_path in file_paths:
+        compile_file(file_path, report, options, output_dir)
+
+
+def find_sources(dir_path: str) -> List[str]:
+    file_paths: List[str] = []
     for file in os.listdir(dir_path):
         file_path: str = os.path.join(dir_path, file)
         _, file_ext = os.path.splitext(file_path)
         if os.path.isfile(file_path) and file_ext.lower() == '.ijk':
-            compile_file(file_path)
+            file_paths.append(file_path)
+    return file_paths
+
+
+def compile_directory(dir_path: str, report: IjkReport = None, options: IjkOptions = None) -> None:
+    compile_files(find_sources(dir_path), report, options)
+
+
+def bundle_runtime(output_dir: str, report: IjkReport = None, options: IjkOptions = None) -> None:
+    # Writes the optimized OS classes next to the program, they replace the stock ones
+    compile_files(sorted(find_sources(RUNTIME_DIR)), report, options, output_dir)
 
 
 def main() -> None:
-    if len(sys.argv) < 2:
-        print('usage: IjkCompiler (file|dir)')
-        sys.exit(1)
+    parser = argparse.ArgumentParser(prog='IjkCompiler')
+    parser.add_argument('path', help='.ijk file or directory to compile')
+    parser.add_argument('--report', action='store_true', help='print the optimization report after compiling')
+    parser.add_argument('--no-intrinsics', action='store_true', help='call trivial OS subroutines instead of inlining them')
+    parser.add_argument('--no-cse', action='store_true', help='do not cache repeated subexpressions in temp slots')
+    parser.add_argument('--pool-alloc', action='store_true',
+                        help='reuse disposed objects through a per-class free list instead of the OS heap')
+    parser.add_argument('--propagate-constants', action='store_true',
+                        help='replace reads of statics and fields assigned a constant only once by the constant')
+    parser.add_argument('--binary', action='store_true', help='also write every class as a binary .vmb file')
+    parser.add_argument('--bundle-runtime', action='store_true',
+                        help='write the optimized Math, Memory, Screen and String classes next to the program')
+    args = parser.parse_args()
 
-    input_path = sys.argv[1]
+    input_path = args.path
+    report: IjkReport = IjkReport()
+    options: IjkOptions = IjkOptions(intrinsics=not args.no_intrinsics, pool_alloc=args.pool_alloc,
+                                     propagate_constants=args.propagate_constants, binary=args.binary,
+                                     cse=not args.no_cse)
 
     if os.path.isdir(input_path):
-        compile_directory(input_path)
+        compile_directory(input_path, report, options)
+        output_dir: str = input_path
     elif os.path.isfile(input_path):
-        compile_file(input_path)
+        compile_files([input_path], report, options)
+        output_dir = os.path.dirname(os.path.abspath(input_path))
     else:
         print("Invalid file/directory, compilation failed")
         sys.exit(1)
 
+    if args.bundle_runtime:
+        bundle_runtime(output_dir, report, options)
+
+    if args.report:
+        print(report)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,156 @@
+from typing import Dict, List, Optional, Tuple
+
+from ijktypes import IjkReport
+
+# Temp slots reserved for cached subexpressions, temp 0 to 2 are used by the compilation engine
+CSE_TEMPS: List[int] = [3, 4, 5, 6, 7]
+
+unary_ops: Tuple[str, ...] = ('neg', 'not')
+binary_ops: Tuple[str, ...] = ('add', 'sub', 'and', 'or', 'eq', 'gt', 'lt')
+
+# A value on the symbolic stack: (start, end, key), key is None when the value is not pure
+Entry = Tuple[int, int, Optional[tuple]]
+
+
+def _find_pure_expressions(block: List[List[str]]) -> Dict[tuple, List[Tuple[int, int]]]:
+    # Executes the block symbolically and returns the code ranges of every pure expression
+    # that takes more than one instruction, grouped by an expression key. Keys carry the
+    # version of every variable and of the memory they read so that stores between two
+    # equal expressions make them different, calls bump the epoch of every key.
+    stack: List[Entry] = []
+    expressions: Dict[tuple, List[Tuple[int, int]]] = {}
+    versions: Dict[Tuple[str, str], int] = {}
+    memory: int = 0
+    epoch: int = 0
+
+    def pop() -> Entry:
+        return stack.pop() if stack else (-1, -1, None)
+
+    def push(start: int, end: int, key: Optional[tuple]) -> None:
+        stack.append((start, end, key))
+        if key and end - start > 1:
+            expressions.setdefault(key, []).append((start, end))
+
+    i: int = 0
+    while i < len(block):
+        command = block[i]
+        action = command[0]
+
+        if action == 'push':
+            segment, offset = command[1], command[2]
+            key = None
+            if segment == 'constant':
+                key = (segment, offset, epoch)
+            elif segment in ('local', 'argument'):
+                key = (segment, offset, versions.get((segment, offset), 0), epoch)
+            elif segment in ('this', 'static') or (segment == 'pointer' and offset == '0'):
+                key = (segment, offset, memory, epoch)
+            push(i, i + 1, key)
+        elif action == 'pop' and command[1:] == ['pointer', '1'] \
+                and i + 1 < len(block) and block[i + 1] == ['push', 'that', '0']:
+            start, end, key = pop()
+            pure: bool = key is not None and end == i
+            push(start, i + 2, ('that', key, memory, epoch) if pure else None)
+            i += 1
+        elif action == 'pop':
+            pop()
+            segment, offset = command[1], command[2]
+            if segment in ('local', 'argument'):
+                versions[(segment, offset)] = versions.get((segment, offset), 0) + 1
+            elif segment in ('this', 'that', 'static') or (segment == 'pointer' and offset == '0'):
+                memory += 1
+        elif action in unary_ops:
+            start, end, key = pop()
+            pure = key is not None and end == i
+            push(start, i + 1, (action, key) if pure else None)
+        elif action in binary_ops:
+            b_start, b_end, b_key = pop()
+            a_start, a_end, a_key = pop()
+            pure = a_key is not None and b_key is not None and a_end == b_start and b_end == i
+            push(a_start, i + 1, (action, a_key, b_key) if pure else None)
+        elif action == 'call':
+            for _ in range(int(command[2])):
+                pop()
+            memory += 1
+            epoch += 1
+            push(i, i + 1, None)
+        else:
+            stack.clear()
+
+        i += 1
+
+    return expressions
+
+
+def eliminate_common_subexpressions(lines: List[str], report: IjkReport) -> List[str]:
+    # Caches pure expressions repeated inside a basic block in a temp slot, the first
+    # occurrence stores its value and the following ones are replaced by a single push
+    block: List[List[str]] = [line.split() for line in lines]
+    expressions = _find_pure_expressions(block)
+
+    claimed: List[Tuple[int, int]] = []
+    replacements: Dict[int, Tuple[int, int]] = {}
+    stores: Dict[int, int] = {}
+    slots: List[int] = list(CSE_TEMPS)
+
+    for key, ranges in sorted(expressions.items(), key=lambda item: item[1][0][1] - item[1][0][0], reverse=True):
+        if not slots:
+            break
+
+        available = [(start, end) for start, end in ranges
+                     if all(end <= c_start or start >= c_end for c_start, c_end in claimed)]
+        length: int = available[0][1] - available[0][0] if available else 0
+        saved: int = (len(available) - 1) * (length - 1) - 2
+
+        if len(available) < 2 or saved <= 0:
+            continue
+
+        slot: int = slots.pop(0)
+        claimed.extend(available)
+        stores[available[0][1] - 1] = slot
+        for start, end in available[1:]:
+            replacements[start] = (end, slot)
+
+        report.count('cse_eliminated', len(available) - 1)
+        report.count('cse_saved_instructions', saved)
+
+    if not replacements:
+        return lines
+
+    optimized: List[str] = []
+    i: int = 0
+    while i < len(lines):
+        if i in replacements:
+            end, slot = replacements[i]
+            optimized.append(f'push temp {slot}')
+            i = end
+            continue
+
+        optimized.append(lines[i])
+        if i in stores:
+            optimized.append(f'pop temp {stores[i]}')
+            optimized.append(f'push temp {stores[i]}')
+        i += 1
+
+    return optimized
+
+
+def find_constants(assignments: List[Tuple[str, str, Optional[int]]], report: IjkReport) -> Dict[str, Dict[str, int]]:
+    # Promotes the statics and fields that are only ever assigned the same constant at the top
+    # level of their subroutine to constants indexed by class name. The implicit zero is recorded
+    # as None for the constructors that leave a field unset and for the reads that may run
+    # before the assignment, so such symbols are never promoted
+    writes: Dict[Tuple[str, str], List[Optional[int]]] = {}
+    for class_name, name, value in assignments:
+        writes.setdefault((class_name, name), []).append(value)
+
+    constants: Dict[str, Dict[str, int]] = {}
+    for (class_name, name), values in writes.items():
+        if values[0] is None or any(value != values[0] for value in values):
+            continue
+
+        constants.setdefault(class_name, {})[name] = values[0]
+        report.count('constants_promoted')
+        report.note(f'promoted {class_name}.{name} = {values[0]}')
+
+    return constants
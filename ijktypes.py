@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List
 
 
 class IjkSymbol(object):
@@ -63,3 +63,43 @@ class IjkSubroutine(object):
 
     def __repr__(self):
         return f"Subroutine({self.subroutine_type} {self.name}({self.args}) -> {self.return_type})"
+
+
+class IjkOptions(object):
+    def __init__(self, intrinsics: bool = True, pool_alloc: bool = False, propagate_constants: bool = False,
+                 binary: bool = False, cse: bool = True) -> None:
+        self.intrinsics: bool = intrinsics
+        self.cse: bool = cse
+        self.pool_alloc: bool = pool_alloc
+        self.propagate_constants: bool = propagate_constants
+        self.binary: bool = binary
+
+        # Statics and fields promoted to constants by class name, filled before compiling
+        self.constants: Dict[str, Dict[str, int]] = {}
+
+    def __repr__(self) -> str:
+        return f"Options(intrinsics={self.intrinsics}, pool_alloc={self.pool_alloc}, " \
+               f"propagate_constants={self.propagate_constants}, binary={self.binary}, cse={self.cse})"
+
+
+class IjkReport(object):
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.notes: List[str] = []
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def note(self, text: str) -> None:
+        self.notes.append(text)
+
+    def __str__(self) -> str:
+        lines = ['Optimization report:']
+        for name, n in sorted(self.counters.items()):
+            lines.append(f'    {name}: {n}')
+        for text in self.notes:
+            lines.append(f'    {text}')
+        return '\n'.join(lines)
+
+    def __repr__(self) -> str:
+        return f"Report({self.counters})"
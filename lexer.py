@@ -241,3 +241,9 @@ class IndentLexer(object):
             return self.token_stream.peek()
         except StopIteration:
             return None
+
+    def peek_token(self, n: int = 0) -> Optional[lex.LexToken]:
+        try:
+            return self.token_stream[n]
+        except IndexError:
+            return None
@@ -1,6 +1,8 @@
-from typing import Dict
+from typing import Callable, Dict, List
 
-from ijktypes import IjkSubroutine, IjkSymbol
+from ijktypes import IjkSubroutine, IjkSymbol, IjkReport
+from ijkoptimizer import eliminate_common_subexpressions
+from vmb import VMBEncoder
 
 kinds: Dict[str, str] = {
     'static':   'static',
@@ -11,34 +13,57 @@ kinds: Dict[str, str] = {
 
 
 class VMWriter(object):
-    def __init__(self, ostream) -> None:
+    def __init__(self, ostream, report: IjkReport = None, binary: VMBEncoder = None, cse: bool = True) -> None:
         self.ostream = ostream
+        self.cse: bool = cse
         self.label_count: int = 0
+        self.report: IjkReport = report if report else IjkReport()
+        self.binary: VMBEncoder = binary
+
+        # Instructions of the current basic block, flushed on every label, jump, function and return
+        self.block: List[str] = []
+
+    def flush(self) -> None:
+        if self.cse:
+            self.block = eliminate_common_subexpressions(self.block, self.report)
+        for line in self.block:
+            self.ostream.write(f'{line}\n')
+            if self.binary:
+                self.binary.add(line)
+        self.block = []
 
     def write_if(self, label: str) -> None:
-        self.ostream.write('not\n')
-        self.ostream.write(f'if-goto {label}\n')
+        self.write('not')
+        self.write_if_goto(label)
+
+    def write_if_goto(self, label: str) -> None:
+        self.write(f'if-goto {label}')
+        self.flush()
 
     def write_goto(self, label: str) -> None:
-        self.ostream.write(f'goto {label}\n')
+        self.write(f'goto {label}')
+        self.flush()
 
     def write_label(self, label: str) -> None:
-        self.ostream.write(f'label {label}\n')
+        self.flush()
+        self.write(f'label {label}')
 
     def write_function(self, fun: IjkSubroutine) -> None:
-        self.ostream.write(f'function {fun.ijk_class.name}.{fun.name} {fun.vars}\n')
+        self.flush()
+        self.write(f'function {fun.ijk_class.name}.{fun.name} {fun.vars}')
 
     def write_return(self) -> None:
-        self.ostream.write(f'return\n')
+        self.write('return')
+        self.flush()
 
     def write_call(self, class_name: str, fun_name: str, args: int) -> None:
-        self.ostream.write(f'call {class_name}.{fun_name} {args}\n')
+        self.write(f'call {class_name}.{fun_name} {args}')
 
     def write_pop(self, segment: str, offset: int) -> None:
-        self.ostream.write(f'pop {segment} {offset}\n')
+        self.write(f'pop {segment} {offset}')
 
     def write_push(self, segment: str, offset: int) -> None:
-        self.ostream.write(f'push {segment} {offset}\n')
+        self.write(f'push {segment} {offset}')
 
     def write_pop_symbol(self, symbol: IjkSymbol) -> None:
         self.write_pop(kinds[symbol.kind], symbol.id)
@@ -47,11 +72,39 @@ class VMWriter(object):
         self.write_push(kinds[symbol.kind], symbol.id)
 
     def write(self, action: str) -> None:
-        self.ostream.write(f'{action}\n')
+        self.block.append(action)
+
+    def fold_constants(self, args: int, fold: Callable[..., int]) -> bool:
+        # Replaces the last `args` constants of the block with the constant result of fold,
+        # a constant is a `push constant n` optionally followed by a `neg`
+        values: List[int] = []
+        end: int = len(self.block)
+        while len(values) < args:
+            if end >= 2 and self.block[end - 1] == 'neg' and self.block[end - 2].startswith('push constant '):
+                values.append(-int(self.block[end - 2].split()[2]))
+                end -= 2
+            elif end >= 1 and self.block[end - 1].startswith('push constant '):
+                values.append(int(self.block[end - 1].split()[2]))
+                end -= 1
+            else:
+                return False
+
+        n: int = fold(*reversed(values))
+        if not -32767 <= n <= 32767:
+            return False
+
+        del self.block[end:]
+        self.write_constant(n)
+        return True
 
     def write_int(self, n: int) -> None:
         self.write_push('constant', n)
 
+    def write_constant(self, n: int) -> None:
+        self.write_int(abs(n))
+        if n < 0:
+            self.write('neg')
+
     def write_string(self, s: str) -> None:
         s = s[1:-1]
         self.write_int(len(s))  # TODO
@@ -59,3 +112,76 @@ class VMWriter(object):
         for c in s:
             self.write_int(ord(c))
             self.write_call('String', 'appendChar', 2)
+
+    def write_multiply_constant(self, n: int) -> None:
+        # Lowers `x * n` into a doubling/add chain, x is already on the stack
+        if n == 0:
+            self.write_pop('temp', 1)
+            self.write_int(0)
+            return
+
+        bits: str = bin(n)[3:]
+
+        if '1' in bits:
+            self.write_pop('temp', 1)
+            self.write_push('temp', 1)
+
+        for bit in bits:
+            self.write_pop('temp', 2)
+            self.write_push('temp', 2)
+            self.write_push('temp', 2)
+            self.write('add')
+            if bit == '1':
+                self.write_push('temp', 1)
+                self.write('add')
+
+    def write_divide_constant(self, n: int, slow_label: str, end_label: str) -> None:
+        # Lowers `x / n` for n a power of two inline, non negative x is shifted
+        # bit by bit and negative x falls back to Math.divide
+        self.write_pop('temp', 1)
+        self.write_push('temp', 1)
+        self.write_int(0)
+        self.write('lt')
+        self.write_if_goto(slow_label)
+
+        self._write_shift(n, 'temp', 1)
+        self.write_goto(end_label)
+
+        self.write_label(slow_label)
+        self.write_push('temp', 1)
+        self.write_int(n)
+        self.write_call('Math', 'divide', 2)
+        self.write_label(end_label)
+
+    def write_divide_helper(self, fun: IjkSubroutine, n: int, slow_label: str) -> None:
+        # Writes a function computing `x / n` like write_divide_constant, divisions outside
+        # of loops call it so the shift is written once per class instead of at each of them
+        self.write_function(fun)
+        self.write_push('argument', 0)
+        self.write_int(0)
+        self.write('lt')
+        self.write_if_goto(slow_label)
+
+        self._write_shift(n, 'argument', 0)
+        self.write_return()
+
+        self.write_label(slow_label)
+        self.write_push('argument', 0)
+        self.write_int(n)
+        self.write_call('Math', 'divide', 2)
+        self.write_return()
+
+    def _write_shift(self, n: int, segment: str, offset: int) -> None:
+        # Pushes the non negative value at segment offset shifted right by log2(n), one bit at a time
+        shift: int = n.bit_length() - 1
+
+        self.write_int(0)
+        for i in range(15 - shift):
+            self.write_push(segment, offset)
+            self.write_int(1 << (i + shift))
+            self.write('and')
+            self.write_int(0)
+            self.write('gt')
+            self.write_int(1 << i)
+            self.write('and')
+            self.write('add')
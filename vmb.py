@@ -0,0 +1,188 @@
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+# Binary VM format (.vmb), all values little endian:
+#   header:  magic 'VMB1', u32 string count, u32 record count, u32 string table size
+#   strings: u16 length + utf-8 bytes for every class, function and label name
+#   records: u8 opcode, u8 segment, u16 count, u32 operand
+# push/pop use segment and operand (index), label/goto/if-goto use operand (string),
+# function/call use operand (string) and count (locals/arguments).
+
+MAGIC: bytes = b'VMB1'
+HEADER: struct.Struct = struct.Struct('<4sIII')
+RECORD: struct.Struct = struct.Struct('<BBHI')
+STRING_LENGTH: struct.Struct = struct.Struct('<H')
+
+opcodes: Tuple[str, ...] = (
+    'push', 'pop',
+    'add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not',
+    'label', 'goto', 'if-goto',
+    'function', 'call', 'return',
+)
+
+segments: Tuple[str, ...] = ('constant', 'local', 'argument', 'this', 'that', 'pointer', 'temp', 'static')
+
+opcode_ids: Dict[str, int] = {name: i for i, name in enumerate(opcodes)}
+segment_ids: Dict[str, int] = {name: i for i, name in enumerate(segments)}
+
+Command = Tuple
+
+
+class VMBEncoder(object):
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+        self.records: bytearray = bytearray()
+        self.count: int = 0
+
+    def _string(self, s: str) -> int:
+        if s not in self.string_ids:
+            self.string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return self.string_ids[s]
+
+    def add(self, line: str) -> None:
+        command: List[str] = line.split()
+        action: str = command[0]
+        opcode: int = opcode_ids[action]
+
+        if action in ('push', 'pop'):
+            record = RECORD.pack(opcode, segment_ids[command[1]], 0, int(command[2]))
+        elif action in ('label', 'goto', 'if-goto'):
+            record = RECORD.pack(opcode, 0, 0, self._string(command[1]))
+        elif action in ('function', 'call'):
+            record = RECORD.pack(opcode, 0, int(command[2]), self._string(command[1]))
+        else:
+            record = RECORD.pack(opcode, 0, 0, 0)
+
+        self.records += record
+        self.count += 1
+
+    def to_bytes(self) -> bytes:
+        table: bytearray = bytearray()
+        for s in self.strings:
+            encoded: bytes = s.encode('utf-8')
+            table += STRING_LENGTH.pack(len(encoded))
+            table += encoded
+
+        return HEADER.pack(MAGIC, len(self.strings), self.count, len(table)) + bytes(table) + bytes(self.records)
+
+    def write(self, path: str) -> None:
+        with open(path, 'wb') as ofile:
+            ofile.write(self.to_bytes())
+
+
+class VMBProgram(object):
+    # Reads a .vmb buffer in place, records are decoded only when accessed
+    def __init__(self, buffer) -> None:
+        self.source = buffer
+        self.buffer: memoryview = memoryview(buffer)
+
+        magic, string_count, self.count, table_size = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a .vmb file')
+
+        self.strings: List[str] = []
+        offset: int = HEADER.size
+        for _ in range(string_count):
+            length, = STRING_LENGTH.unpack_from(self.buffer, offset)
+            offset += STRING_LENGTH.size
+            self.strings.append(str(self.buffer[offset:offset + length], 'utf-8'))
+            offset += length
+
+        self.records: memoryview = self.buffer[HEADER.size + table_size:]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Command:
+        if not 0 <= i < self.count:
+            raise IndexError('record index out of range')
+        return self._decode(*RECORD.unpack_from(self.records, i * RECORD.size))
+
+    def __iter__(self) -> Iterator[Command]:
+        for record in RECORD.iter_unpack(self.records):
+            yield self._decode(*record)
+
+    def _decode(self, opcode: int, segment: int, count: int, operand: int) -> Command:
+        action: str = opcodes[opcode]
+
+        if action in ('push', 'pop'):
+            return action, segments[segment], operand
+        elif action in ('label', 'goto', 'if-goto'):
+            return action, self.strings[operand]
+        elif action in ('function', 'call'):
+            return action, self.strings[operand], count
+        return action,
+
+    def lines(self) -> Iterator[str]:
+        for command in self:
+            yield ' '.join(str(part) for part in command)
+
+    def release(self) -> None:
+        # Closes the mapping too so the file can be rewritten right away
+        self.records.release()
+        self.buffer.release()
+        if isinstance(self.source, mmap.mmap):
+            self.source.close()
+
+
+def load(path: str) -> VMBProgram:
+    # Maps the file in memory, the program stays valid while the mapping is referenced
+    with open(path, 'rb') as ifile:
+        buffer: mmap.mmap = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+    return VMBProgram(buffer)
+
+
+def read_text(path: str) -> List[Command]:
+    # Parses a textual .vm file into the same commands a VMBProgram yields
+    commands: List[Command] = []
+    with open(path, 'r') as ifile:
+        for line in ifile:
+            line = line.split('//')[0].strip()
+            if not line:
+                continue
+            command: List = line.split()
+            if command[0] in ('push', 'pop', 'function', 'call'):
+                command[2] = int(command[2])
+            commands.append(tuple(command))
+    return commands
+
+
+def encode_text(path: str) -> VMBEncoder:
+    encoder: VMBEncoder = VMBEncoder()
+    with open(path, 'r') as ifile:
+        for line in ifile:
+            line = line.split('//')[0].strip()
+            if line:
+                encoder.add(line)
+    return encoder
+
+
+def main() -> None:
+    # Converts between .vm and .vmb, the output is written next to the input
+    if len(sys.argv) < 2:
+        print('usage: vmb.py (file.vm|file.vmb)')
+        sys.exit(1)
+
+    input_path: str = sys.argv[1]
+    path_no_ext, ext = os.path.splitext(input_path)
+
+    if ext.lower() == '.vm':
+        encode_text(input_path).write(path_no_ext + '.vmb')
+    elif ext.lower() == '.vmb':
+        program: VMBProgram = load(input_path)
+        with open(path_no_ext + '.vm', 'w') as ofile:
+            for line in program.lines():
+                ofile.write(f'{line}\n')
+        program.release()
+    else:
+        print("Invalid file, conversion failed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()